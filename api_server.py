@@ -1,17 +1,47 @@
 import os
 import asyncio
+import logging
+import orjson
 from aiohttp import web
 
-from license_core import db_init, db_check_and_bind
+from license_core import (
+    db_init, db_close, db_check_and_bind, rate_limit_ok, RATE_LIMIT_MAX
+)
+from bootstrap import run_main
+
+logger = logging.getLogger(__name__)
+
+# Only honour X-Forwarded-For behind a proxy that sets it (e.g. Render);
+# otherwise clients could pick a fresh rate-limit bucket per request.
+TRUST_FORWARDED_FOR = os.environ.get("TRUST_FORWARDED_FOR", "0") == "1"
+
+def client_ip(request: web.Request) -> str:
+    # Behind Render's proxy the peer address is the proxy's. The proxy appends
+    # the real client last; earlier hops are client-supplied.
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.remote or ""
+
+def json_response(data, status: int = 200) -> web.Response:
+    # orjson already yields bytes, so skip aiohttp's str dumps + re-encode.
+    return web.Response(body=orjson.dumps(data), status=status, content_type="application/json")
+
+# Built once; a Response object itself can't be reused across requests.
+HEALTH_BODY = orjson.dumps({"ok": True})
 
 async def api_health(_: web.Request):
-    return web.json_response({"ok": True})
+    return web.Response(body=HEALTH_BODY, content_type="application/json")
 
 async def api_activate(request: web.Request):
+    if not rate_limit_ok(client_ip(request), request.loop.time()):
+        return json_response({"ok": False, "message": "rate_limited"}, status=429)
+
     try:
-        data = await request.json()
+        data = await request.json(loads=orjson.loads)
     except Exception:
-        return web.json_response({"ok": False, "message": "bad_json"}, status=400)
+        return json_response({"ok": False, "message": "bad_json"}, status=400)
 
     license_key = str(data.get("license_key", "")).strip()
     hwid = str(data.get("hwid", "")).strip()
@@ -19,9 +49,9 @@ async def api_activate(request: web.Request):
     ok, msg, expires_at = await db_check_and_bind(license_key, hwid)
     if not ok:
         status = 401
-        return web.json_response({"ok": False, "message": msg}, status=status)
+        return json_response({"ok": False, "message": msg}, status=status)
 
-    return web.json_response({"ok": True, "expires_at": expires_at})
+    return json_response({"ok": True, "expires_at": expires_at})
 
 def build_api_app() -> web.Application:
     app = web.Application()
@@ -29,8 +59,8 @@ def build_api_app() -> web.Application:
     app.router.add_post("/v1/activate", api_activate)
     return app
 
+# start_api() expects db_init() to have been awaited by the caller.
 async def start_api():
-    await db_init()
     host = "0.0.0.0"
     port = int(os.environ.get("PORT", "8080"))  # Render uses PORT
     app = build_api_app()
@@ -38,11 +68,25 @@ async def start_api():
     await runner.setup()
     site = web.TCPSite(runner, host, port)
     await site.start()
-    print(f"API listening on http://{host}:{port}")
+    logger.info("API listening on http://%s:%s", host, port)
+    if RATE_LIMIT_MAX > 0 and not TRUST_FORWARDED_FOR:
+        logger.warning(
+            "Rate limiting by peer address (TRUST_FORWARDED_FOR is off). Behind a proxy "
+            "such as Render every client shares the proxy's bucket; set TRUST_FORWARDED_FOR=1."
+        )
+
+    try:
+        # Keep alive forever without waking the loop
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
 
-    # Keep alive forever
-    while True:
-        await asyncio.sleep(3600)
+async def _main():
+    await db_init()
+    try:
+        await start_api()
+    finally:
+        await db_close()
 
 if __name__ == "__main__":
-    asyncio.run(start_api())
+    run_main(_main())
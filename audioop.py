@@ -4,4 +4,8 @@
 def _nope(*args, **kwargs):
     raise NotImplementedError("audioop is not available. Voice features disabled.")
 
-add = avg = bias = cross = findfactor = findmax = getsample = lin2adpcm = lin2alaw = lin2lin = lin2ulaw = max = minmax = mul = ratecv = reverse = rms = tomono = tostereo = ulaw2lin = alaw2lin = adpcm2lin = _nope
+# Every audioop function (add, mul, ratecv, tostereo, ...) resolves to _nope.
+def __getattr__(name):
+    if name.startswith("__"):
+        raise AttributeError(name)
+    return _nope
@@ -0,0 +1,59 @@
+# Process startup shared by the api_server, bot_worker and combined entrypoints.
+import sys
+import signal
+import queue
+import asyncio
+import logging
+import logging.handlers
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
+def setup_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    # Handlers on the event loop only enqueue; a listener thread does the stdout writes.
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.setLevel(level)
+    # aiohttp logs every request at INFO; keep that off the hot path.
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    root.addHandler(logging.handlers.QueueHandler(q))
+    listener = logging.handlers.QueueListener(q, handler)
+    listener.start()
+    return listener
+
+async def _until_sigterm(main):
+    # Render stops instances with SIGTERM; treat it like Ctrl-C by cancelling
+    # the main task so its finally blocks (db_close, runner cleanup) still run.
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    stopping = False
+
+    def stop():
+        nonlocal stopping
+        stopping = True
+        task.cancel()
+
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop)
+    except NotImplementedError:  # Windows event loops
+        signal.signal(signal.SIGTERM, lambda *_: loop.call_soon_threadsafe(stop))
+
+    try:
+        return await main
+    except asyncio.CancelledError:
+        if not stopping:
+            raise
+        logging.getLogger(__name__).info("SIGTERM received, shut down.")
+
+def run_main(main):
+    listener = setup_logging()
+    try:
+        if uvloop is not None:
+            return uvloop.run(_until_sigterm(main))
+        return asyncio.run(_until_sigterm(main))
+    finally:
+        listener.stop()
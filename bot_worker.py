@@ -1,13 +1,16 @@
 import os
-import asyncio
+import logging
 import discord
 from discord import app_commands
 from typing import Optional
 
 from license_core import (
-    db_init, db_create_license, db_find_license_row, db_set_revoked,
+    db_init, db_close, db_create_license, db_create_licenses, db_find_license_row, db_set_revoked,
     db_delete_license, db_add_time, db_reset_hwid, now_ts, fmt_ts, normalize_key
 )
+from bootstrap import run_main
+
+logger = logging.getLogger(__name__)
 
 TOKEN = os.environ.get("DISCORD_BOT_TOKEN", "")
 GUILD_ID = int(os.environ.get("GUILD_ID", "0"))
@@ -33,6 +36,10 @@ async def deny(interaction: discord.Interaction):
         ephemeral=True
     )
 
+def admin_check():
+    # Runs before option parsing, so denied callers are rejected up front.
+    return app_commands.check(require_admin)
+
 DURATION_SECONDS = {
     "1d": 1 * 24 * 3600,
     "3d": 3 * 24 * 3600,
@@ -49,30 +56,36 @@ DURATION_CHOICES = [
     app_commands.Choice(name="lifetime", value="lifetime"),
 ]
 
+# Keeps the bulk reply under Discord's 2000-character message limit.
+LIC_GEN_BULK_MAX = 25
+
 class Bot(discord.Client):
     def __init__(self):
         super().__init__(intents=discord.Intents.default())
         self.tree = app_commands.CommandTree(self)
 
     async def setup_hook(self):
-        await db_init()
         guild_obj = discord.Object(id=GUILD_ID)
         self.tree.copy_global_to(guild=guild_obj)
         await self.tree.sync(guild=guild_obj)
-        print("Synced commands to guild.")
+        logger.info("Synced commands to guild.")
 
 bot = Bot()
 
 @bot.event
 async def on_ready():
-    print(f"Bot online as {bot.user} ({bot.user.id})")
+    logger.info("Bot online as %s (%s)", bot.user, bot.user.id)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.CheckFailure):
+        return await deny(interaction)
+    await app_commands.CommandTree.on_error(bot.tree, interaction, error)
 
 @bot.tree.command(name="lic_gen", description="(Admin) Generate a license key")
+@admin_check()
 @app_commands.choices(duration=DURATION_CHOICES)
 async def lic_gen(interaction: discord.Interaction, duration: app_commands.Choice[str]):
-    if not require_admin(interaction):
-        return await deny(interaction)
-
     seconds = DURATION_SECONDS[duration.value]
     exp = None if seconds is None else now_ts() + int(seconds)
 
@@ -86,12 +99,31 @@ async def lic_gen(interaction: discord.Interaction, duration: app_commands.Choic
         ephemeral=True
     )
 
+@bot.tree.command(name="lic_gen_bulk", description="(Admin) Generate several license keys at once")
+@admin_check()
+@app_commands.describe(count=f"How many keys (1-{LIC_GEN_BULK_MAX})")
+@app_commands.choices(duration=DURATION_CHOICES)
+async def lic_gen_bulk(interaction: discord.Interaction, count: int, duration: app_commands.Choice[str]):
+    if count <= 0 or count > LIC_GEN_BULK_MAX:
+        return await interaction.response.send_message("Invalid count.", ephemeral=True)
+
+    seconds = DURATION_SECONDS[duration.value]
+    exp = None if seconds is None else now_ts() + int(seconds)
+
+    keys = await db_create_licenses(count, expires_at=exp, created_by=interaction.user.id)
+    await interaction.response.send_message(
+        "\n".join([
+            f"✅ **{len(keys)} licenses generated**",
+            f"Expires: {fmt_ts(exp)}",
+            *(f"`{key}`" for key in keys),
+        ]),
+        ephemeral=True
+    )
+
 @bot.tree.command(name="lic_info", description="(Admin) Show license status")
+@admin_check()
 @app_commands.describe(license_key="The license key")
 async def lic_info(interaction: discord.Interaction, license_key: str):
-    if not require_admin(interaction):
-        return await deny(interaction)
-
     license_key = normalize_key(license_key)
     row = await db_find_license_row(license_key)
     if not row:
@@ -113,34 +145,30 @@ async def lic_info(interaction: discord.Interaction, license_key: str):
     )
 
 @bot.tree.command(name="lic_revoke", description="(Admin) Revoke a license")
+@admin_check()
 @app_commands.describe(license_key="The license key")
 async def lic_revoke(interaction: discord.Interaction, license_key: str):
-    if not require_admin(interaction):
-        return await deny(interaction)
     ok = await db_set_revoked(normalize_key(license_key), True)
     await interaction.response.send_message("✅ Revoked." if ok else "Not found.", ephemeral=True)
 
 @bot.tree.command(name="lic_unrevoke", description="(Admin) Unrevoke a license")
+@admin_check()
 @app_commands.describe(license_key="The license key")
 async def lic_unrevoke(interaction: discord.Interaction, license_key: str):
-    if not require_admin(interaction):
-        return await deny(interaction)
     ok = await db_set_revoked(normalize_key(license_key), False)
     await interaction.response.send_message("✅ Unrevoked." if ok else "Not found.", ephemeral=True)
 
 @bot.tree.command(name="lic_delete", description="(Admin) DELETE a license (permanent)")
+@admin_check()
 @app_commands.describe(license_key="The license key")
 async def lic_delete(interaction: discord.Interaction, license_key: str):
-    if not require_admin(interaction):
-        return await deny(interaction)
     ok = await db_delete_license(normalize_key(license_key))
     await interaction.response.send_message("✅ Deleted." if ok else "Not found.", ephemeral=True)
 
 @bot.tree.command(name="lic_addtime", description="(Admin) Add time to a license")
+@admin_check()
 @app_commands.describe(license_key="The license key", days="Days to add (e.g. 7)")
 async def lic_addtime(interaction: discord.Interaction, license_key: str, days: int):
-    if not require_admin(interaction):
-        return await deny(interaction)
     if days <= 0 or days > 3650:
         return await interaction.response.send_message("Invalid days.", ephemeral=True)
 
@@ -153,15 +181,23 @@ async def lic_addtime(interaction: discord.Interaction, license_key: str, days:
     await interaction.response.send_message(f"✅ Added time. New expires_at: {fmt_ts(int(info))}", ephemeral=True)
 
 @bot.tree.command(name="lic_reset_hwid", description="(Admin) Unbind HWID so it can activate on a new PC")
+@admin_check()
 @app_commands.describe(license_key="The license key")
 async def lic_reset_hwid(interaction: discord.Interaction, license_key: str):
-    if not require_admin(interaction):
-        return await deny(interaction)
     ok = await db_reset_hwid(normalize_key(license_key))
     await interaction.response.send_message("✅ HWID reset." if ok else "Not found.", ephemeral=True)
 
+# start_bot() expects db_init() to have been awaited by the caller.
 async def start_bot():
-    await bot.start(TOKEN)
+    async with bot:
+        await bot.start(TOKEN)
+
+async def _main():
+    await db_init()
+    try:
+        await start_bot()
+    finally:
+        await db_close()
 
 if __name__ == "__main__":
-    asyncio.run(start_bot())
+    run_main(_main())
@@ -1,12 +1,18 @@
 import asyncio
 from api_server import start_api
 from bot_worker import start_bot
+from license_core import db_init, db_close
+from bootstrap import run_main
 
 async def main():
-    await asyncio.gather(
-        start_api(),
-        start_bot()
-    )
+    # One DB connection for both; a failure in either cancels the other.
+    await db_init()
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(start_api())
+            tg.create_task(start_bot())
+    finally:
+        await db_close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_main(main())
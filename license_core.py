@@ -1,11 +1,18 @@
 import os
+import re
 import time
+import asyncio
+import logging
 import secrets
 import hashlib
-from typing import Optional, Dict, Tuple
+import contextlib
+from array import array
+from typing import Optional, Dict, List, Tuple
 
 import aiosqlite
 
+logger = logging.getLogger(__name__)
+
 LICENSE_PEPPER = os.environ.get("LICENSE_PEPPER", "")
 if not LICENSE_PEPPER or len(LICENSE_PEPPER) < 32:
     raise SystemExit("Missing/weak LICENSE_PEPPER env var. Use 32+ chars random.")
@@ -23,152 +30,332 @@ if _db_dir and not os.path.exists(_db_dir):
 def now_ts() -> int:
     return int(time.time())
 
-def sha256_hex(b: bytes) -> str:
-    return hashlib.sha256(b).hexdigest()
-
 def normalize_key(k: str) -> str:
     return k.strip().upper()
 
-def hash_license_key(license_key: str) -> str:
-    return sha256_hex(PEPPER_BYTES + normalize_key(license_key).encode("utf-8"))
+# Keyed BLAKE2b with the pepper as key (blake2b accepts at most 64 key bytes).
+# The key block is absorbed once here; each hash starts from a copy.
+HASH_KEY = PEPPER_BYTES[:64]
+_PEPPERED = hashlib.blake2b(key=HASH_KEY, digest_size=32)
+
+def peppered_digest(b: bytes) -> bytes:
+    h = _PEPPERED.copy()
+    h.update(b)
+    return h.digest()
+
+def hash_license_key(license_key: str) -> bytes:
+    return peppered_digest(normalize_key(license_key).encode("utf-8"))
+
+def hash_hwid(hwid: str) -> bytes:
+    return peppered_digest(hwid.strip().lower().encode("utf-8"))
+
+# Older databases hold sha256(pepper + value) hex TEXT hashes; rows are
+# rewritten to the current BLOB scheme the first time they're used.
+_LEGACY_PEPPERED = hashlib.sha256(PEPPER_BYTES)
+
+def legacy_peppered_hex(b: bytes) -> str:
+    h = _LEGACY_PEPPERED.copy()
+    h.update(b)
+    return h.hexdigest()
 
-def hash_hwid(hwid: str) -> str:
-    return sha256_hex(PEPPER_BYTES + hwid.strip().lower().encode("utf-8"))
+def legacy_hash_license_key(license_key: str) -> str:
+    return legacy_peppered_hex(normalize_key(license_key).encode("utf-8"))
+
+def legacy_hash_hwid(hwid: str) -> str:
+    return legacy_peppered_hex(hwid.strip().lower().encode("utf-8"))
+
+# 32 symbols, so masking a random byte to 5 bits picks one uniformly.
+LICENSE_ALPHABET = b"ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+_KEY_TABLE = bytes(LICENSE_ALPHABET[b & 0x1F] for b in range(256))
+
+# Exactly what generate_license_key() produces (after normalize_key).
+LICENSE_KEY_RE = re.compile(r"DBX(?:-[A-HJ-NP-Z2-9]{5}){5}")
+# Hex, base32 or GUID-style machine ids (after lower()).
+HWID_RE = re.compile(r"[0-9a-z-]{16,128}")
 
 def generate_license_key() -> str:
-    alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
-    def group(n: int) -> str:
-        return "".join(secrets.choice(alphabet) for _ in range(n))
-    return "DBX-" + "-".join(group(5) for _ in range(5))
+    chars = secrets.token_bytes(25).translate(_KEY_TABLE).decode("ascii")
+    return "DBX-" + "-".join(chars[i:i + 5] for i in range(0, 25, 5))
 
 def fmt_ts(ts: Optional[int]) -> str:
     if ts is None:
         return "lifetime"
     return f"<t:{ts}:F> (<t:{ts}:R>)"
 
+# Per-client fixed-window rate limit for the web API. Times are event-loop
+# (monotonic) seconds. Clients hash into a fixed set of buckets, so memory is
+# bounded without eviction; the rare clients sharing a bucket share a budget.
+# Disabled unless RATE_LIMIT_MAX is set to a positive number of hits per window.
+RATE_LIMIT_WINDOW = int(os.environ.get("RATE_LIMIT_WINDOW", "60"))
+RATE_LIMIT_MAX = int(os.environ.get("RATE_LIMIT_MAX", "0"))
+RATE_LIMIT_BUCKETS = 1 << 16
+
+_RATE_MASK = RATE_LIMIT_BUCKETS - 1
+_rate_hits = array("q", bytes(8 * RATE_LIMIT_BUCKETS))
+_rate_reset = array("d", bytes(8 * RATE_LIMIT_BUCKETS))
+
+def rate_limit_ok(client: str, now: float) -> bool:
+    if RATE_LIMIT_MAX <= 0:
+        return True
+    i = hash(client) & _RATE_MASK
+    if now >= _rate_reset[i]:
+        _rate_reset[i] = now + RATE_LIMIT_WINDOW
+        _rate_hits[i] = 1
+        return True
+
+    hits = _rate_hits[i] + 1
+    _rate_hits[i] = hits
+    return hits <= RATE_LIMIT_MAX
+
 CREATE_LICENSES_SQL = """
 CREATE TABLE IF NOT EXISTS licenses (
   id            INTEGER PRIMARY KEY AUTOINCREMENT,
-  license_hash  TEXT UNIQUE NOT NULL,
+  license_hash  BLOB UNIQUE NOT NULL,
   created_at    INTEGER NOT NULL,
   created_by    INTEGER NOT NULL,
   expires_at    INTEGER,
   revoked       INTEGER NOT NULL DEFAULT 0,
-  hwid_hash     TEXT,
+  hwid_hash     BLOB,
   last_seen_at  INTEGER
 );
 CREATE INDEX IF NOT EXISTS idx_license_hash ON licenses(license_hash);
 """
 
+# WAL lets activations read while an admin write is in flight; NORMAL is durable under WAL.
+DB_PRAGMAS_SQL = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-64000;
+PRAGMA busy_timeout=5000;
+PRAGMA mmap_size=268435456;
+"""
+
+# SQL used by the db_* helpers.
+INSERT_LICENSE_SQL = "INSERT INTO licenses(license_hash, created_at, created_by, expires_at, revoked) VALUES(?,?,?,?,0)"
+FIND_LICENSE_SQL = (
+    "SELECT id, created_at, created_by, expires_at, revoked, hwid_hash, last_seen_at "
+    "FROM licenses WHERE license_hash=?"
+)
+SET_REVOKED_SQL = "UPDATE licenses SET revoked=? WHERE license_hash=?"
+DELETE_LICENSE_SQL = "DELETE FROM licenses WHERE license_hash=?"
+GET_EXPIRES_SQL = "SELECT expires_at FROM licenses WHERE license_hash=?"
+SET_EXPIRES_SQL = "UPDATE licenses SET expires_at=? WHERE license_hash=?"
+RESET_HWID_SQL = "UPDATE licenses SET hwid_hash=NULL WHERE license_hash=?"
+CHECK_LICENSE_SQL = "SELECT id, expires_at, revoked, hwid_hash FROM licenses WHERE license_hash=?"
+BIND_HWID_SQL = "UPDATE licenses SET hwid_hash=COALESCE(hwid_hash, ?) WHERE id=? RETURNING hwid_hash"
+SET_LAST_SEEN_SQL = "UPDATE licenses SET last_seen_at=? WHERE id=?"
+LICENSE_EXISTS_SQL = "SELECT 1 FROM licenses WHERE license_hash=?"
+UPGRADE_LICENSE_HASH_SQL = "UPDATE licenses SET license_hash=? WHERE license_hash=?"
+UPGRADE_HWID_HASH_SQL = "UPDATE licenses SET hwid_hash=? WHERE id=? AND hwid_hash=?"
+COUNT_LEGACY_KEYS_SQL = "SELECT COUNT(*) FROM licenses WHERE typeof(license_hash)='text'"
+
+_DB: Optional[aiosqlite.Connection] = None
+_WRITE_LOCK = asyncio.Lock()
+
+# last_seen_at is informational only, so activations buffer it here and a
+# background task writes the batch out every SEEN_FLUSH_INTERVAL seconds.
+SEEN_FLUSH_INTERVAL = 5
+_pending_seen: Dict[int, int] = {}
+_seen_task: Optional[asyncio.Task] = None
+
+# Legacy license hashes left to upgrade: counted once by db_init() and
+# decremented per upgrade, so the fallback switches off without rescanning.
+_legacy_keys = 0
+
+def _db() -> aiosqlite.Connection:
+    if _DB is None:
+        raise RuntimeError("db_init() must be awaited before using the database.")
+    return _DB
+
+@contextlib.asynccontextmanager
+async def _write_txn(db: aiosqlite.Connection):
+    # The connection is shared, so a failed write must not leave its half-done
+    # transaction for readers to see or the next writer to commit.
+    async with _WRITE_LOCK:
+        try:
+            yield
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
 async def db_init():
-    print("DB_PATH:", DB_PATH)
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.executescript(CREATE_LICENSES_SQL)
-        await db.commit()
+    global _DB, _seen_task, _legacy_keys
+    if _DB is not None:
+        return
+    logger.info("DB_PATH: %s", DB_PATH)
+    db = await aiosqlite.connect(DB_PATH)
+    await db.executescript(DB_PRAGMAS_SQL)
+    await db.executescript(CREATE_LICENSES_SQL)
+    async with db.execute(COUNT_LEGACY_KEYS_SQL) as cur:
+        (_legacy_keys,) = await cur.fetchone()
+    await db.commit()
+    _DB = db
+    _seen_task = asyncio.create_task(_seen_flush_loop())
 
-async def db_create_license(expires_at: Optional[int], created_by: int) -> str:
-    key = generate_license_key()
-    lhash = hash_license_key(key)
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO licenses(license_hash, created_at, created_by, expires_at, revoked) VALUES(?,?,?,?,0)",
-            (lhash, now_ts(), created_by, expires_at)
-        )
-        await db.commit()
-    return key
+async def db_close():
+    global _DB, _seen_task
+    if _DB is None:
+        return
+    if _seen_task is not None:
+        _seen_task.cancel()
+        try:
+            await _seen_task
+        except asyncio.CancelledError:
+            pass
+        _seen_task = None
+    await _flush_seen()
+    db, _DB = _DB, None
+    await db.close()
 
-async def db_find_license_row(license_key: str):
+async def _flush_seen():
+    global _pending_seen
+    if not _pending_seen:
+        return
+    batch, _pending_seen = _pending_seen, {}
+    db = _db()
+    try:
+        async with _write_txn(db):
+            await db.executemany(SET_LAST_SEEN_SQL, [(t, lic_id) for lic_id, t in batch.items()])
+    except BaseException:
+        # Put the batch back for the next flush; newer activations win.
+        for lic_id, t in batch.items():
+            _pending_seen.setdefault(lic_id, t)
+        raise
+
+async def _seen_flush_loop():
+    while True:
+        await asyncio.sleep(SEEN_FLUSH_INTERVAL)
+        try:
+            await _flush_seen()
+        except Exception:
+            logger.exception("last_seen_at flush failed")
+
+async def _upgrade_legacy_key(db: aiosqlite.Connection, license_key: str, lhash: bytes) -> bool:
+    # Called after a lookup by lhash missed: re-key license_key's legacy row if
+    # it has one. The probe is read-only, so unknown keys never take the lock.
+    global _legacy_keys
+    if _legacy_keys <= 0:
+        return False
+    legacy = legacy_hash_license_key(license_key)
+    async with db.execute(LICENSE_EXISTS_SQL, (legacy,)) as cur:
+        if not await cur.fetchone():
+            return False
+    async with _write_txn(db):
+        async with db.execute(UPGRADE_LICENSE_HASH_SQL, (lhash, legacy)) as cur:
+            changed = cur.rowcount > 0
+    if changed:
+        _legacy_keys -= 1
+    return changed
+
+async def _keyed(license_key: str, op):
+    # Run op(db, lhash), which returns None when no row matches; on a miss,
+    # upgrade a legacy row for license_key and retry once.
+    db = _db()
     lhash = hash_license_key(license_key)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT id, created_at, created_by, expires_at, revoked, hwid_hash, last_seen_at "
-            "FROM licenses WHERE license_hash=?",
-            (lhash,)
-        )
+    result = await op(db, lhash)
+    if result is None and await _upgrade_legacy_key(db, license_key, lhash):
+        result = await op(db, lhash)
+    return result
+
+async def db_create_license(expires_at: Optional[int], created_by: int) -> str:
+    return (await db_create_licenses(1, expires_at, created_by))[0]
+
+async def db_create_licenses(count: int, expires_at: Optional[int], created_by: int) -> List[str]:
+    keys = [generate_license_key() for _ in range(count)]
+    t = now_ts()
+    rows = [(hash_license_key(key), t, created_by, expires_at) for key in keys]
+    db = _db()
+    async with _write_txn(db):
+        await db.executemany(INSERT_LICENSE_SQL, rows)
+    return keys
+
+async def _fetch_one(db: aiosqlite.Connection, sql: str, params: tuple):
+    async with db.execute(sql, params) as cur:
         return await cur.fetchone()
 
+async def _write_changed(db: aiosqlite.Connection, sql: str, params: tuple) -> Optional[bool]:
+    async with _write_txn(db):
+        async with db.execute(sql, params) as cur:
+            changed = cur.rowcount > 0
+    return True if changed else None
+
+async def db_find_license_row(license_key: str):
+    return await _keyed(license_key, lambda db, lhash: _fetch_one(db, FIND_LICENSE_SQL, (lhash,)))
+
 async def db_set_revoked(license_key: str, revoked: bool) -> bool:
-    lhash = hash_license_key(license_key)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("UPDATE licenses SET revoked=? WHERE license_hash=?",
-                               (1 if revoked else 0, lhash))
-        await db.commit()
-        return cur.rowcount > 0
+    flag = 1 if revoked else 0
+    return bool(await _keyed(license_key, lambda db, lhash: _write_changed(db, SET_REVOKED_SQL, (flag, lhash))))
 
 async def db_delete_license(license_key: str) -> bool:
-    lhash = hash_license_key(license_key)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("DELETE FROM licenses WHERE license_hash=?", (lhash,))
-        await db.commit()
-        return cur.rowcount > 0
+    return bool(await _keyed(license_key, lambda db, lhash: _write_changed(db, DELETE_LICENSE_SQL, (lhash,))))
 
 async def db_add_time(license_key: str, add_seconds: int) -> Tuple[bool, str]:
-    lhash = hash_license_key(license_key)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT expires_at FROM licenses WHERE license_hash=?", (lhash,))
-        row = await cur.fetchone()
-        if not row:
-            return False, "not_found"
+    async def add(db: aiosqlite.Connection, lhash: bytes):
+        async with _write_txn(db):
+            async with db.execute(GET_EXPIRES_SQL, (lhash,)) as cur:
+                row = await cur.fetchone()
+            if not row:
+                return None
+
+            expires_at = row[0]
+            if expires_at is None:
+                return True, "lifetime_noop"
 
-        expires_at = row[0]
-        if expires_at is None:
-            return True, "lifetime_noop"
+            base = max(int(expires_at), now_ts())
+            new_exp = base + int(add_seconds)
 
-        base = max(int(expires_at), now_ts())
-        new_exp = base + int(add_seconds)
+            await db.execute(SET_EXPIRES_SQL, (new_exp, lhash))
+            return True, str(new_exp)
 
-        await db.execute("UPDATE licenses SET expires_at=? WHERE license_hash=?",
-                         (new_exp, lhash))
-        await db.commit()
-        return True, str(new_exp)
+    return await _keyed(license_key, add) or (False, "not_found")
 
 async def db_reset_hwid(license_key: str) -> bool:
-    lhash = hash_license_key(license_key)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("UPDATE licenses SET hwid_hash=NULL WHERE license_hash=?", (lhash,))
-        await db.commit()
-        return cur.rowcount > 0
+    return bool(await _keyed(license_key, lambda db, lhash: _write_changed(db, RESET_HWID_SQL, (lhash,))))
 
 # API validate/bind HWID (shared by web API)
 async def db_check_and_bind(license_key: str, hwid: str) -> Tuple[bool, str, Optional[int]]:
     license_key = normalize_key(license_key)
     hwid = hwid.strip().lower()
-    if len(license_key) < 10 or len(license_key) > 128:
+    # Reject malformed input before spending a hash or a DB probe on it.
+    if not LICENSE_KEY_RE.fullmatch(license_key):
         return False, "invalid", None
-    if len(hwid) < 16 or len(hwid) > 128:
+    if not HWID_RE.fullmatch(hwid):
         return False, "invalid", None
 
-    lhash = hash_license_key(license_key)
     hh = hash_hwid(hwid)
     t = now_ts()
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT id, expires_at, revoked, hwid_hash FROM licenses WHERE license_hash=?",
-            (lhash,)
-        )
-        row = await cur.fetchone()
-        if not row:
-            return False, "invalid", None
+    db = _db()
+    row = await _keyed(license_key, lambda db, lhash: _fetch_one(db, CHECK_LICENSE_SQL, (lhash,)))
+    if not row:
+        return False, "invalid", None
 
-        lic_id, expires_at, revoked, bound_hwid = row
-        if revoked:
-            return False, "invalid", None
+    lic_id, expires_at, revoked, bound_hwid = row
+    if revoked:
+        return False, "invalid", None
 
-        if expires_at is not None and int(expires_at) < t:
-            return False, "expired", None
+    if expires_at is not None and int(expires_at) < t:
+        return False, "expired", None
 
-        if bound_hwid is None:
-            await db.execute(
-                "UPDATE licenses SET hwid_hash=?, last_seen_at=? WHERE id=?",
-                (hh, t, lic_id)
-            )
-            await db.commit()
-            return True, "ok", expires_at
+    if bound_hwid is None:
+        # First activation: bind atomically, keeping whichever HWID won a race.
+        async with _write_txn(db):
+            async with db.execute(BIND_HWID_SQL, (hh, lic_id)) as cur:
+                bound = await cur.fetchone()
+        if not bound:
+            return False, "invalid", None
+        bound_hwid = bound[0]
+
+    # Legacy HWID hashes are TEXT, so current BLOB rows skip the SHA-256 entirely.
+    if isinstance(bound_hwid, str) and bound_hwid == legacy_hash_hwid(hwid):
+        async with _write_txn(db):
+            await db.execute(UPGRADE_HWID_HASH_SQL, (hh, lic_id, bound_hwid))
+        bound_hwid = hh
 
-        if str(bound_hwid) != str(hh):
-            return False, "hwid_mismatch", None
+    if bound_hwid != hh:
+        return False, "hwid_mismatch", None
 
-        await db.execute("UPDATE licenses SET last_seen_at=? WHERE id=?", (t, lic_id))
-        await db.commit()
-        return True, "ok", expires_at
+    _pending_seen[lic_id] = t
+    return True, "ok", expires_at